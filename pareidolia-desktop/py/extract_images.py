@@ -1,42 +1,81 @@
 import cv2
 import sys
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 
+JPEG_QUALITY = 90
+
+def write_jpeg(file_path, frame):
+    # encode and write one frame, runs on a worker thread
+    # returns False without writing anything if encoding fails
+    encoded, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not encoded:
+        print(f"Failed to encode {file_path}, skipping.")
+        return False
+    with open(file_path, 'wb') as file:
+        file.write(buffer.tobytes())
+    return True
+
 def video_to_frames(video_path, output_folder):
     # create ouput folder if not already present
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    # open video file
-    video_capture = cv2.VideoCapture(video_path)
+    # open video file, decoding on the GPU (NVDEC, VA-API, D3D11) when one is available
+    # falls back to software decoding otherwise
+    video_capture = cv2.VideoCapture(
+        video_path,
+        cv2.CAP_ANY,
+        [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+    )
     # get fps to calculate 1/2 second intervals
     fps = video_capture.get(cv2.CAP_PROP_FPS)
     save_interval = int (round(fps/4))
     frame_count = 0
-    saved_count = 0
     video_name_f = os.path.basename(video_path)
     video_name = os.path.splitext(video_name_f)[0]
     success = True
+    saved_count = 0
+    # encoding releases the GIL, so workers encode while this thread keeps decoding
+    max_workers = os.cpu_count() or 1
+    # cap queued frames so decoding cannot get far ahead of encoding and fill memory
+    max_pending = 2 * max_workers
+    pending = deque()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while success:
+                # advance to the next frame without converting it
+                success = video_capture.grab()
+                
+                if success:
+                    if frame_count % save_interval == 0:
+                        # only decode the frames that are kept
+                        success, frame = video_capture.retrieve()
+                        if not success:
+                            break
+
+                        # create file name
+                        file_name = f"{video_name}_frame_{frame_count}.jpg"
+                        file_path = os.path.join(output_folder, file_name)
+                    
+                        # create jpeg, retrieve() returns a new array so the frame is safe to hand off
+                        pending.append(executor.submit(write_jpeg, file_path, frame))
+                        # wait on the oldest write once too many are queued
+                        # only frames that were actually written are counted
+                        if len(pending) > max_pending:
+                            saved_count += pending.popleft().result()
+                    
+                    frame_count += 1
 
-    while success:
-        # read frames from video
-        success, frame = video_capture.read()
-        
-        if success:
-            if frame_count % save_interval == 0:
-                # create file name
-                file_name = f"{video_name}_frame_{frame_count}.jpg"
-                file_path = os.path.join(output_folder, file_name)
-            
-                # create jpeg
-                cv2.imwrite(file_path, frame)
-
-                saved_count += 1
-            
-            frame_count += 1
-    # release
-    video_capture.release()
+            # wait for the remaining writes, raising any error from a worker
+            while pending:
+                saved_count += pending.popleft().result()
+    finally:
+        # release
+        video_capture.release()
     print(f"Created {saved_count} images at {output_folder}.")
 
 if __name__ == "__main__":
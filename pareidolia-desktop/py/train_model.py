@@ -7,11 +7,14 @@ Future work will allow the python function to execute successfully and allow fle
 """
 import sys
 import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import cv2
 import tensorflow as tf
 from tensorflow import keras
-from tensorflow.keras import layers, models
+from tensorflow.keras import layers, models, mixed_precision
 
 # Model constants
 IMG_HEIGHT = 224
@@ -21,27 +24,47 @@ IMG_CHANNELS = 3
 NUM_CLASSES = 2  # Binary classification: thing present or not present
 LEARNING_RATE = 0.001
 
+# Input pipeline constants
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png'})
+BATCH_SIZE = 32
+VALIDATION_SPLIT = 0.2
+SHUFFLE_BUFFER_SIZE = 1000
+SHUFFLE_SEED = 123
+# Scale factors libjpeg can shrink a JPEG by while decoding, largest first
+JPEG_DECODE_RATIOS = (8, 4, 2, 1)
+# Decoded datasets larger than this are cached to disk instead of RAM
+CACHE_MEMORY_LIMIT_BYTES = 2 * 1024 ** 3
+# Number of images used to calibrate INT8 quantization
+REPRESENTATIVE_SAMPLES = 500
+# Number of camera frames collected before each prediction call
+FRAME_BATCH_SIZE = 16
+
 def create_cnn_model():
     """Creates a CNN model for image classification."""
     model = models.Sequential([
-        layers.Input(shape=(IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS)),
+        # Images are fed as uint8, a quarter of the size of float32
+        layers.Input(shape=(IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS), dtype='uint8'),
+        
+        # Normalize raw 0..255 pixels inside the model so it runs on the GPU
+        layers.Rescaling(1. / 255),
         
         # Conv Block 1
         layers.Conv2D(16, 3, padding='same', activation='relu'),
         layers.MaxPooling2D(),
         
         # Conv Block 2
-        layers.Conv2D(32, 3, padding='same', activation='relu'),
+        # Depthwise-separable from here on, roughly 8x fewer multiply-adds than a full Conv2D
+        layers.SeparableConv2D(32, 3, padding='same', activation='relu'),
         layers.MaxPooling2D(),
         
         # Conv Block 3
-        layers.Conv2D(64, 3, padding='same', activation='relu'),
+        layers.SeparableConv2D(64, 3, padding='same', activation='relu'),
         layers.MaxPooling2D(),
         
         layers.Dropout(0.2),
         
-        # Flatten
-        layers.Flatten(),
+        # Average each feature map down to one value, far fewer weights than Flatten
+        layers.GlobalAveragePooling2D(),
         
         # Dense Layers
         layers.Dense(128, activation='relu'),
@@ -52,77 +75,187 @@ def create_cnn_model():
         
         layers.Dense(32, activation='relu'),
         
-        layers.Dense(NUM_CLASSES, activation='softmax')
+        # Softmax and the loss stay in float32 for numerical stability
+        layers.Dense(NUM_CLASSES, activation='softmax', dtype='float32')
     ])
     
+    # Under a mixed_float16 policy, compile() wraps the optimizer in a LossScaleOptimizer itself
     model.compile(
         optimizer=keras.optimizers.Adam(learning_rate=LEARNING_RATE),
         loss='categorical_crossentropy',
-        metrics=['accuracy']
+        metrics=['accuracy'],
+        # Compile the train step with XLA so Conv+ReLU+Pool run as fused kernels
+        jit_compile=True
     )
     
     return model
 
-def load_images_from_folders(positives_path, negatives_path):
-    """Load images from separate positive and negative folders."""
-    images = []
-    labels = []
+def list_image_files(folder):
+    """Lists the image files in a folder, or nothing if the folder does not exist."""
+    if not os.path.exists(folder):
+        return []
     
-    # Load negative images (label 0)
-    if os.path.exists(negatives_path):
-        for img_file in os.listdir(negatives_path):
-            if img_file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                img_path = os.path.join(negatives_path, img_file)
-                
-                img = cv2.imread(img_path)
-                if img is None:
-                    continue
-                    
-                img = cv2.resize(img, (IMG_WIDTH, IMG_HEIGHT))
-                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                
-                images.append(img)
-                labels.append(0)  # Negative class
+    # scandir entries carry the file type, so this needs no extra stat call per file
+    with os.scandir(folder) as entries:
+        return [
+            entry.path
+            for entry in entries
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+        ]
+
+def decode_jpeg_scaled(contents):
+    """Decodes a JPEG at the largest scale factor that still leaves at least IMG_HEIGHT x IMG_WIDTH pixels."""
+    shape = tf.io.extract_jpeg_shape(contents)
+    max_ratio = tf.minimum(shape[0] // IMG_HEIGHT, shape[1] // IMG_WIDTH)
+    # Index of the largest ratio that is not above max_ratio
+    ratio_index = tf.reduce_sum(tf.cast(max_ratio < JPEG_DECODE_RATIOS[:-1], tf.int32))
+    return tf.switch_case(ratio_index, [
+        lambda ratio=ratio: tf.io.decode_jpeg(
+            contents, channels=IMG_CHANNELS, ratio=ratio, dct_method='INTEGER_FAST'
+        )
+        for ratio in JPEG_DECODE_RATIOS
+    ])
+
+def decode_resize(img_path, label):
+    """
+    Reads, decodes and resizes a single image inside the tf.data pipeline.
+    Unlike cv2.imread, tf.io does not apply EXIF orientation, so rotated photos are used as stored.
+    Frames from extract_images.py carry no EXIF data and are unaffected.
+    """
+    contents = tf.io.read_file(img_path)
+    img = tf.cond(
+        tf.io.is_jpeg(contents),
+        lambda: decode_jpeg_scaled(contents),
+        lambda: tf.io.decode_png(contents, channels=IMG_CHANNELS)
+    )
+    # Antialiased like the prediction paths, so training and camera frames are shrunk the same way
+    img = tf.image.resize(img, [IMG_HEIGHT, IMG_WIDTH], antialias=True)
+    # Keep pixels as uint8 so the cache and host to device copies stay small
+    img = tf.saturate_cast(tf.round(img), tf.uint8)
+    return img, tf.one_hot(label, NUM_CLASSES)
+
+def _load_class(folder, label):
+    """Lists the images for one class and pairs each with its label."""
+    img_paths = list_image_files(folder)
+    return img_paths, [label] * len(img_paths)
+
+def load_images_from_folders(positives_path, negatives_path, cache_dir=None):
+    """
+    Builds training and validation tf.data pipelines from separate positive and negative folders.
+    Decoding and resizing run in parallel and overlap with training instead of loading every image up front.
     
-    # Load positive images (label 1)
-    if os.path.exists(positives_path):
-        for img_file in os.listdir(positives_path):
-            if img_file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                img_path = os.path.join(positives_path, img_file)
-                
-                img = cv2.imread(img_path)
-                if img is None:
-                    continue
-                    
-                img = cv2.resize(img, (IMG_WIDTH, IMG_HEIGHT))
-                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                
-                images.append(img)
-                labels.append(1)  # Positive class
+    @param positives_path: Folder containing the positive images
+    @param negatives_path: Folder containing the negative images
+    @param cache_dir: Folder for the decoded image cache, used when the dataset is too big for RAM
+    @returns: (train_ds, val_ds, num_images), or (None, None, 0) if no images were found.
+              num_images counts candidate files; ones that fail to decode are skipped during training.
+              val_ds is None when there are too few images to hold any back for validation.
+    """
+    # Negative images are label 0, positive images are label 1
+    # Both folders are listed at the same time, directory reads release the GIL
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        negatives = executor.submit(_load_class, negatives_path, 0)
+        positives = executor.submit(_load_class, positives_path, 1)
+        negative_paths, negative_labels = negatives.result()
+        positive_paths, positive_labels = positives.result()
     
-    if len(images) == 0:
-        return None, None
+    img_paths = negative_paths + positive_paths
+    labels = negative_labels + positive_labels
+    num_images = len(img_paths)
     
-    images = np.array(images, dtype='float32') / 255.0
-    labels = keras.utils.to_categorical(labels, NUM_CLASSES)
+    if num_images == 0:
+        return None, None, 0
     
-    return images, labels
+    # Shuffle the file list once so both splits contain both classes
+    files_ds = tf.data.Dataset.from_tensor_slices((img_paths, labels)).shuffle(
+        num_images, seed=SHUFFLE_SEED, reshuffle_each_iteration=False
+    )
+    # Hold back at least one image for validation whenever there are two or more
+    num_val = max(1, int(num_images * VALIDATION_SPLIT)) if num_images >= 2 else 0
+    
+    # Decoding runs once on the first epoch, later epochs read the cache
+    dataset_bytes = num_images * IMG_HEIGHT * IMG_WIDTH * IMG_CHANNELS
+    use_disk_cache = cache_dir is not None and dataset_bytes > CACHE_MEMORY_LIMIT_BYTES
+    
+    def build_pipeline(split_ds, split_name, training):
+        # Unreadable images are skipped, the same as a failed cv2.imread used to be
+        ds = split_ds.map(decode_resize, num_parallel_calls=tf.data.AUTOTUNE).ignore_errors()
+        # Decoded images are cached before shuffling so every epoch still gets a new order
+        ds = ds.cache(os.path.join(cache_dir, split_name) if use_disk_cache else '')
+        if training:
+            ds = ds.shuffle(SHUFFLE_BUFFER_SIZE)
+        return ds.batch(BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+    
+    train_ds = build_pipeline(files_ds.skip(num_val), 'train', training=True)
+    val_ds = build_pipeline(files_ds.take(num_val), 'val', training=False) if num_val > 0 else None
+    
+    return train_ds, val_ds, num_images
+
+def prefetch_to_gpu(dataset):
+    """
+    Stages batches in GPU memory so the host to device copy overlaps the training step.
+    This must be the last transformation, so only apply it to the datasets given to model.fit.
+    """
+    if not tf.config.list_physical_devices('GPU'):
+        return dataset
+    
+    return dataset.apply(tf.data.experimental.prefetch_to_device('/gpu:0', buffer_size=2))
+
+@tf.function
+def _preprocess_frames_on_device(frames):
+    """Resizes a stack of raw uint8 BGR frames in one call, keeping them in BGR order."""
+    # Antialiased to match training, where JPEGs are box-filtered by libjpeg's scaled decode
+    # The antialiased kernel is not guaranteed an XLA lowering, so this is not jit-compiled
+    imgs = tf.image.resize(frames, [IMG_HEIGHT, IMG_WIDTH], method='bilinear', antialias=True)
+    return tf.saturate_cast(tf.round(imgs), tf.uint8)
 
 def preprocess_frame(frame):
-    """Preprocess a frame for prediction."""
-    img = cv2.resize(frame, (IMG_WIDTH, IMG_HEIGHT))
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img = img.astype('float32') / 255.0
-    img = np.expand_dims(img, axis=0)
-    return img
+    """
+    Preprocess a frame, or a stack of same-sized frames, for prediction.
+    The result stays in OpenCV's BGR order; pass it to run_batch, which converts it to RGB.
+    """
+    # Upload the raw uint8 frames once, the rest runs on the device
+    frames = tf.convert_to_tensor(frame)
+    if frames.shape.rank == 3:
+        frames = tf.expand_dims(frames, axis=0)
+    return _preprocess_frames_on_device(frames)
+
+def create_frame_buffer(batch_size=FRAME_BATCH_SIZE):
+    """Preallocates the uint8 buffer camera frames are collected into for batched prediction."""
+    return np.empty((batch_size, IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS), dtype=np.uint8)
+
+def buffer_frame(frame, buffer, index):
+    """
+    Resizes a camera frame into one slot of a frame buffer, still in BGR order like preprocess_frame.
+    Once every slot is filled, pass the buffer to run_batch and start again from index 0.
+    
+    @param frame: Raw BGR frame from OpenCV
+    @param buffer: Buffer from create_frame_buffer
+    @param index: Slot to write the frame into
+    """
+    # Resize straight into the preallocated slot, no temporary image or copy
+    # INTER_AREA averages source pixels when shrinking, matching the antialiased training resize
+    cv2.resize(frame, (IMG_WIDTH, IMG_HEIGHT), dst=buffer[index], interpolation=cv2.INTER_AREA)
+
+@tf.function(jit_compile=True)
+def _predict_batch(model, batch):
+    # The only BGR to RGB conversion for prediction, where XLA fuses it into the first layer
+    return model(tf.reverse(batch, axis=[-1]), training=False)
+
+def run_batch(model, buffer):
+    """
+    Predicts a whole batch of frames in one model call and returns the class probabilities.
+    Takes uint8 BGR frames, either a buffer filled by buffer_frame or the output of preprocess_frame.
+    """
+    return _predict_batch(model, tf.convert_to_tensor(buffer))
 
-def convert_model_to_tflite(model, X_train, model_folder):
+def convert_model_to_tflite(model, train_ds, model_folder):
     """
     Converts a trained Keras model to TensorFlow Lite format with quantization.
     Saves both the original .keras model and the converted .tflite model.
     
     @param model: The trained Keras model
-    @param X_train: Training data for representative dataset (for quantization)
+    @param train_ds: Batched training dataset used as the representative dataset (for quantization)
     @param model_folder: Folder path where models will be saved
     """
     try:
@@ -135,29 +268,44 @@ def convert_model_to_tflite(model, X_train, model_folder):
         print(f"Keras model saved to: {keras_model_path}")
         
         # Create inference model (remove data_augmentation layer if it exists)
-        inference_layers = [l for l in model.layers if l.name != "data_augmentation"]
+        # Layers are rebuilt in float32 so a mixed precision model converts cleanly
+        source_layers = [l for l in model.layers if l.name != "data_augmentation"]
+        inference_layers = [
+            l.__class__.from_config({**l.get_config(), 'dtype': 'float32'})
+            for l in source_layers
+        ]
         inference_model = tf.keras.Sequential(inference_layers)
         
-        # Build the inference model with sample data
+        # Build the inference model with sample data, then copy the trained weights over
         _ = inference_model(tf.zeros([1, IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS], tf.float32))
+        for source_layer, inference_layer in zip(source_layers, inference_layers):
+            inference_layer.set_weights(source_layer.get_weights())
         
         # Define representative dataset for quantization
+        def class_filter(class_index):
+            return lambda x, y: tf.equal(tf.argmax(y, output_type=tf.int32), class_index)
+        
         def representative_dataset():
-            for i in range(min(200, len(X_train))):
-                x = X_train[i:i+1].astype(np.float32)
-                # Data should already be normalized (0..1) from preprocessing
-                yield [x]
+            # Draw each sample from a randomly picked class, equally weighted, so calibration
+            # ranges cover both; once the smaller class runs out the rest come from the larger one.
+            # Each class filter reads through the cached train_ds on its own, so the
+            # training set is read once per class, a small cost next to the conversion itself.
+            samples = train_ds.unbatch()
+            per_class = [samples.filter(class_filter(c)) for c in range(NUM_CLASSES)]
+            balanced = tf.data.Dataset.sample_from_datasets(per_class, seed=0)
+            for x, _ in balanced.take(REPRESENTATIVE_SAMPLES).batch(1):
+                # Raw 0..255 pixels, the model's Rescaling layer normalizes them
+                yield [tf.cast(x, tf.float32)]
         
         # Convert to TFLite with quantization
         converter = tf.lite.TFLiteConverter.from_keras_model(inference_model)
         converter.optimizations = [tf.lite.Optimize.DEFAULT]
         converter.representative_dataset = representative_dataset
-        converter.target_spec.supported_ops = [
-            tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
-            tf.lite.OpsSet.TFLITE_BUILTINS,
-        ]
+        # INT8 only, with no float fallback and its quantize/dequantize ops between layers
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.target_spec.supported_types = [tf.int8]
         converter.inference_input_type = tf.uint8
-        converter.inference_output_type = tf.float32
+        converter.inference_output_type = tf.uint8
         
         # Convert the model
         tflite_model = converter.convert()
@@ -169,7 +317,8 @@ def convert_model_to_tflite(model, X_train, model_folder):
         print(f"TFLite model saved to: {tflite_model_path}")
         
         # Print model details
-        interpreter = tf.lite.Interpreter(model_path=tflite_model_path)
+        # Let the interpreter use every core when this model is run, instead of a single thread
+        interpreter = tf.lite.Interpreter(model_path=tflite_model_path, num_threads=os.cpu_count())
         interpreter.allocate_tensors()
         
         in0 = interpreter.get_input_details()[0]
@@ -220,41 +369,61 @@ if __name__ == "__main__":
     print(f"Model will be saved to: {model_path}")
     print(f"Training for {epochs} epochs")
     
-    # Load and prepare images
-    X_train, y_train = load_images_from_folders(positives_path, negatives_path)
-    
-    if X_train is None or len(X_train) == 0:
-        print("Error: No images found or failed to load images")
-        sys.exit(1)
-    
-    print(f"Loaded {len(X_train)} images")
-    
-    # Create the model
-    model = create_cnn_model()
-    print("Model created successfully")
-    
-    # Train the model
-    print(f"Starting training for {epochs} epochs...")
-    history = model.fit(
-        X_train, y_train,
-        epochs=epochs,
-        batch_size=32,
-        validation_split=0.2,
-        verbose=1
-    )
-    
-    # Get final metrics
-    final_loss = history.history['loss'][-1]
-    final_accuracy = history.history['accuracy'][-1]
-    final_val_loss = history.history['val_loss'][-1]
-    final_val_accuracy = history.history['val_accuracy'][-1]
-    
     # Get the model folder from model_path
     model_folder = os.path.dirname(model_path)
     
-    # Convert model to TFLite and save both formats
-    print("Converting model to TFLite format...")
-    conversion_result = convert_model_to_tflite(model, X_train, model_folder)
+    # The decoded image cache lives next to the model rather than in the system temp folder,
+    # which is often a RAM-backed tmpfs. It is removed however training ends.
+    # A bare model file name has no folder, so the current directory is used then.
+    cache_parent = model_folder or '.'
+    os.makedirs(cache_parent, exist_ok=True)
+    cache_dir = tempfile.mkdtemp(prefix='.cache_', dir=cache_parent)
+    try:
+        # Load and prepare images
+        train_ds, val_ds, num_images = load_images_from_folders(positives_path, negatives_path, cache_dir)
+        
+        if train_ds is None or num_images == 0:
+            print("Error: No images found or failed to load images")
+            sys.exit(1)
+        
+        print(f"Found {num_images} candidate image files")
+        
+        # Train in float16 with float32 weights on GPUs, where Tensor Cores make it faster.
+        # On the CPU float16 is slower, so the default float32 policy is kept there.
+        # This is set here rather than at import so modules using the inference helpers keep their policy.
+        if tf.config.list_physical_devices('GPU'):
+            mixed_precision.set_global_policy('mixed_float16')
+        
+        # Create the model
+        model = create_cnn_model()
+        print("Model created successfully")
+        
+        # Train the model
+        print(f"Starting training for {epochs} epochs...")
+        history = model.fit(
+            prefetch_to_gpu(train_ds),
+            validation_data=prefetch_to_gpu(val_ds) if val_ds is not None else None,
+            epochs=epochs,
+            verbose=1
+        )
+        
+        # Every candidate failing to decode leaves fit with zero steps and no metrics
+        if 'loss' not in history.history:
+            print("Error: No images found or failed to load images")
+            sys.exit(1)
+        
+        # Get final metrics
+        final_loss = history.history['loss'][-1]
+        final_accuracy = history.history['accuracy'][-1]
+        # Validation metrics are missing when there was no validation split
+        final_val_loss = history.history.get('val_loss', [None])[-1]
+        final_val_accuracy = history.history.get('val_accuracy', [None])[-1]
+        
+        # Convert model to TFLite and save both formats
+        print("Converting model to TFLite format...")
+        conversion_result = convert_model_to_tflite(model, train_ds, model_folder)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
     
     if not conversion_result['success']:
         print(f"Warning: TFLite conversion failed: {conversion_result['error']}")
@@ -264,6 +433,7 @@ if __name__ == "__main__":
     # Print final metrics in a format easy to parse for the UI
     print(f"FINAL_LOSS:{final_loss}")
     print(f"FINAL_ACCURACY:{final_accuracy}")
-    print(f"FINAL_VAL_LOSS:{final_val_loss}")
-    print(f"FINAL_VAL_ACCURACY:{final_val_accuracy}")
+    if final_val_loss is not None:
+        print(f"FINAL_VAL_LOSS:{final_val_loss}")
+        print(f"FINAL_VAL_ACCURACY:{final_val_accuracy}")
 